@@ -1,36 +1,368 @@
 # elasticsearch 7.17.9
+# orjson
+# httpx（可选，用于异步批量写入）
 from elasticsearch import Elasticsearch
 from elasticsearch import AsyncElasticsearch
-from datetime import datetime, timezone
-from typing import Dict, Any, Optional
+from elasticsearch.compat import string_types
+from elasticsearch.exceptions import (
+    HTTP_EXCEPTIONS,
+    ConnectionError as ESConnectionError,
+    ConnectionTimeout,
+    SerializationError,
+    TransportError,
+)
+from elasticsearch.helpers import BulkIndexError
+from elasticsearch.serializer import JSONSerializer
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Tuple
 import asyncio
+import gzip
+import itertools
+import logging
+import threading
+import time
+import weakref
+from urllib.parse import urlsplit, urlunsplit
+
+import orjson
+
+try:
+    import httpx
+except ImportError:  # 未安装 httpx 时由 AsyncElasticsearch 发送异步批量请求
+    httpx = None
+
+_log = logging.getLogger(__name__)
+
+# 日志级别数值，低于 min_level 的日志在构建条目前直接丢弃；
+# 导入时即收录大写、小写和首字母大写三种写法，常见写法无需每次转换大小写
+LEVELS = {
+    variant: n
+    for name, n in {
+        "DEBUG": 10,
+        "INFO": 20,
+        "WARNING": 30,
+        "WARN": 30,
+        "ERROR": 40,
+        "CRITICAL": 50,
+        "FATAL": 50,
+    }.items()
+    for variant in (name, name.lower(), name.title())
+}
+
+# 异步批量请求只取回失败条目
+_BULK_PARAMS = {"filter_path": "errors,items.*.error"}
+
+
+# 当前分钟的时间戳前缀缓存: (自纪元起的分钟数, "YYYY-MM-DDTHH:MM:")
+_minute_prefix: Tuple[int, str] = (-1, "")
+
+
+def _format_timestamp(time_ns: int) -> str:
+    """
+    将自纪元起的纳秒数格式化为 UTC 时间戳，格式为 YYYY-MM-DDTHH:MM:SS.mmmZ
+    
+    日期和时分部分按分钟缓存，跨分钟时才重新格式化，
+    每条日志只需拼接秒和毫秒。
+    """
+    global _minute_prefix
+    minute, ms = divmod(time_ns // 1_000_000, 60_000)
+    cached_minute, prefix = _minute_prefix
+    if minute != cached_minute:
+        prefix = time.strftime("%Y-%m-%dT%H:%M:", time.gmtime(minute * 60))
+        _minute_prefix = (minute, prefix)
+    return f"{prefix}{ms // 1000:02d}.{ms % 1000:03d}Z"
+
+
+def _utc_timestamp() -> str:
+    """生成当前 UTC 时间戳，格式为 YYYY-MM-DDTHH:MM:SS.mmmZ"""
+    return _format_timestamp(time.time_ns())
+
+
+@lru_cache(maxsize=256)
+def _static_fields_json(service: str,
+                        level: str,
+                        logger: Optional[str],
+                        environment: Optional[str]) -> bytes:
+    """
+    预先序列化通用日志中重复出现的字段
+    
+    返回:
+        不含外层花括号的 JSON 片段，如 b'"service":"python-app","level":"INFO"'
+    """
+    fields = {"service": service, "level": level}
+    if logger is not None:
+        fields["logger"] = logger
+    if environment is not None:
+        fields["environment"] = environment
+    return orjson.dumps(fields)[1:-1]
+
+
+@lru_cache(maxsize=256)
+def _create_action(index: str) -> bytes:
+    """
+    预先序列化 Bulk API 的 create 操作行（含换行符）
+    
+    返回:
+        如 b'{"create":{"_index":"mh-logs-common"}}\\n'
+    """
+    return orjson.dumps({"create": {"_index": index}}) + b"\n"
+
+
+# 由 ingest pipeline mh-logs-process 计算 result 的数据流
+# （索引模板 mh-logs-process-template 只匹配该名称，见 创建索引的时间管理.txt）
+_RESULT_PIPELINE_INDEX = "mh-logs-process"
+
+
+def _process_result(target_index: str,
+                    expected_value: Optional[str],
+                    actual_value: Optional[str],
+                    result: Optional[str]) -> Optional[str]:
+    """
+    得到处理日志要写入的 result
+    
+    写入 mh-logs-process 时留给 ingest pipeline 计算；写入其他索引
+    （自定义 default_index 或 index）时没有该 pipeline，在这里比较期望值和实际值。
+    """
+    if (result is None and target_index != _RESULT_PIPELINE_INDEX
+            and actual_value is not None and expected_value is not None):
+        return "success" if actual_value == expected_value else "failure"
+    return result
+
+
+class LogEntry:
+    """
+    异步队列中等待写入的日志
+    
+    排队期间只保存时间戳整数和各字段引用，由消费者在攒批时再组装为文档并序列化，
+    使用 __slots__，比直接排队日志字典占用更少内存。
+    """
+    __slots__ = ("ts", "index", "message", "level", "service", "extras")
+    
+    def __init__(self,
+                 ts: int,
+                 index: str,
+                 message: str,
+                 level: str,
+                 service: str,
+                 extras: Optional[Dict[str, Any]] = None):
+        self.ts = ts                # 自纪元起的纳秒数（time.time_ns()）
+        self.index = index          # 目标索引/数据流名称
+        self.message = message
+        self.level = level
+        self.service = service
+        self.extras = extras        # 日志类型特定字段和额外字段
+    
+    def to_document(self) -> Dict[str, Any]:
+        """组装为写入 Elasticsearch 的日志文档"""
+        document: Dict[str, Any] = {
+            "@timestamp": _format_timestamp(self.ts),
+            "message": self.message,
+            "level": self.level,
+            "service": self.service,
+        }
+        if self.extras:
+            document.update(self.extras)
+        return document
+
+
+class OrjsonSerializer(JSONSerializer):
+    """使用 orjson 替代标准库 json 的请求体序列化器"""
+    
+    def loads(self, s):
+        try:
+            return orjson.loads(s)
+        except (ValueError, TypeError) as e:
+            raise SerializationError(s, e)
+    
+    def dumps(self, data):
+        # 已序列化的字符串直接透传
+        if isinstance(data, string_types):
+            return data
+        return self.dumps_bytes(data).decode()
+    
+    def dumps_bytes(self, data) -> bytes:
+        """序列化为 UTF-8 编码的 JSON 字节串（用于直接拼接 NDJSON 请求体）"""
+        try:
+            return orjson.dumps(data, default=self.default,
+                                option=orjson.OPT_NON_STR_KEYS)
+        except (ValueError, TypeError) as e:
+            raise SerializationError(data, e)
+
 
 class ElasticsearchLogger:
+    # 按构造参数缓存的实例，见 get()；持有强引用，close()/close_sync() 时移除
+    _instances: Dict[tuple, "ElasticsearchLogger"] = {}
+    _instances_lock = threading.Lock()
+    
     def __init__(self, 
                  hosts: list = ['http://localhost:9200'], 
                  default_index: str = "mh-logs",
-                 timeout: int = 30):
+                 timeout: int = 30,
+                 maxsize: int = 64,
+                 http_compress: bool = True,
+                 flush_interval_s: float = 5.0,
+                 max_batch_docs: int = 500,
+                 max_batch_bytes: int = 5 * 1024 * 1024,
+                 queue_maxsize: int = 10000,
+                 min_batch_ms: float = 1.0,
+                 max_batch_ms: float = 50.0,
+                 min_level: str = "DEBUG"):
         """
         初始化Elasticsearch日志记录器（支持同步和异步）
         
+        同步日志先写入内存缓冲区，达到条数/字节数阈值或超过刷新间隔时
+        通过 Bulk API 批量写入，减少 HTTP 请求次数。
+        异步日志放入队列，由单个后台消费者任务攒批后通过 Bulk API 写入。
+        
+        实例是线程安全的，多个线程应共享同一个 ElasticsearchLogger，
+        而不是各自创建（每个实例都持有自己的连接池）。
+        应只创建一次并复用，不要在每个请求中创建新实例，推荐使用 get()。
+        
         参数:
             hosts: Elasticsearch主机地址列表
             default_index: 默认的索引/数据流名称前缀
             timeout: 连接超时时间（秒）
+            maxsize: 每个节点的最大连接数（连接池大小），应与并发调用数相当
+            http_compress: 是否对请求体进行 gzip 压缩（日志字段重复度高，压缩率好）
+            flush_interval_s: 同步缓冲区的刷新间隔（秒），由后台守护线程定时刷新
+            max_batch_docs: 单批最大日志条数
+            max_batch_bytes: 单批最大字节数
+            queue_maxsize: 异步日志队列的最大长度（队列满时 log_async 等待）
+            min_batch_ms: 事件循环繁忙时异步攒批窗口的长度（毫秒，降低延迟）
+            max_batch_ms: 事件循环空闲时异步攒批窗口的长度（毫秒，提高吞吐）
+            min_level: 最低记录级别（不区分大小写），低于该级别的日志直接丢弃（未知级别总是记录）
         """
-        # 同步客户端
-        self.es = Elasticsearch(
-            hosts,
-            timeout=timeout
-        )
+        if min_level.upper() not in LEVELS:
+            raise ValueError(f"未知的日志级别: {min_level}")
+        self._min_level_n = LEVELS[min_level.upper()]
+        
+        # 同步客户端在首次使用时才创建（见 es 属性），只用异步接口时不占用连接池
+        self._es: Optional[Elasticsearch] = None
+        self._es_lock = threading.Lock()
+        self._hosts = hosts
+        self._timeout = timeout
+        self._maxsize = maxsize
+        self._http_compress = http_compress
+        self._serializer = OrjsonSerializer()
         
         # 异步客户端
         self.async_es = AsyncElasticsearch(
             hosts,
-            timeout=timeout
+            timeout=timeout,
+            maxsize=maxsize,
+            http_compress=http_compress,
+            serializer=self._serializer
         )
         
+        # 异步批量写入的快速通道：用 httpx 直接 POST /_bulk，不经过客户端的请求封装；
+        # AsyncElasticsearch 仍保留用于其他请求，未安装 httpx 时也用它发送批量请求。
+        # httpx 客户端在首次发送批量请求时才创建，只用同步接口时不占用连接池
+        self._http: Optional["httpx.AsyncClient"] = None
+        self._bulk_urls = None
+        if httpx is not None and all(isinstance(host, str) for host in hosts):
+            self._bulk_urls = itertools.cycle([self._bulk_url(host) for host in hosts])
+            self._bulk_url_count = len(hosts)
+        
         self.default_index = default_index
+        # 预先拼接各日志类型的目标索引名，避免每条日志都格式化字符串
+        self._index_for = {
+            "common": f"{default_index}-common",
+            "process": f"{default_index}-process",
+        }
+        
+        # 批量写入缓冲区：直接存放 NDJSON 格式的 Bulk 请求体
+        self.flush_interval_s = flush_interval_s
+        self.max_batch_docs = max_batch_docs
+        self.max_batch_bytes = max_batch_bytes
+        self._buffer = bytearray()
+        self._buffer_docs: int = 0
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        
+        # 定时刷新同步缓冲区的守护线程（首次写入同步缓冲区时启动）
+        self._flush_thread: Optional[threading.Thread] = None
+        self._flush_stop = threading.Event()
+        # 记录器被回收或进程退出时写出剩余日志的终结器（与守护线程一同创建）
+        self._finalizer: Optional[weakref.finalize] = None
+        
+        # 因序列化或写入失败而丢弃的日志条数
+        self.dropped_logs: int = 0
+        
+        # 异步日志队列及其消费者任务（在事件循环中首次调用 log_async 时创建）
+        self.queue_maxsize = queue_maxsize
+        self._queue: Optional[asyncio.Queue] = None
+        self._consumer: Optional[asyncio.Task] = None
+        
+        # 异步攒批窗口（秒），由 _wait_batch_window 根据事件循环利用率调整
+        self._min_batch_s = min_batch_ms / 1000
+        self._max_batch_s = max_batch_ms / 1000
+        self._batch_window = self._min_batch_s
+    
+    @classmethod
+    def get(cls,
+            hosts: list = ['http://localhost:9200'],
+            default_index: str = "mh-logs",
+            timeout: int = 30,
+            **kwargs) -> "ElasticsearchLogger":
+        """
+        获取共享的日志记录器实例
+        
+        相同参数返回同一个实例（直到该实例被关闭），避免重复创建客户端和连接池。
+        缓存持有实例的强引用，因此可以直接 ElasticsearchLogger.get(...).log(...)，
+        不必自行保存实例。
+        
+        参数:
+            参数与构造函数中的同名参数相同，其余构造参数通过 kwargs 传入
+            
+        返回:
+            ElasticsearchLogger 实例
+        """
+        # 字典形式的主机地址（如 {"host": "localhost", "port": 9200}）不可哈希，转换为有序元组
+        host_key = tuple(tuple(sorted(host.items())) if isinstance(host, dict) else host
+                         for host in hosts)
+        key = (host_key, default_index, timeout, tuple(sorted(kwargs.items())))
+        with cls._instances_lock:
+            instance = cls._instances.get(key)
+            if instance is None:
+                instance = cls(hosts, default_index=default_index, timeout=timeout, **kwargs)
+                cls._instances[key] = instance
+            return instance
+    
+    def _forget(self):
+        """从 get() 的实例缓存中移除自身，关闭后的实例不再被复用"""
+        cls = type(self)
+        with cls._instances_lock:
+            for key, instance in list(cls._instances.items()):
+                if instance is self:
+                    del cls._instances[key]
+    
+    @property
+    def es(self) -> Elasticsearch:
+        """
+        同步客户端（延迟创建）
+        
+        在锁内创建，守护线程和调用方线程同时首次访问时也只创建一个客户端
+        （Python 3.12 起 cached_property 不再加锁）。
+        """
+        if self._es is None:
+            with self._es_lock:
+                if self._es is None:
+                    self._es = Elasticsearch(
+                        self._hosts,
+                        timeout=self._timeout,
+                        maxsize=self._maxsize,
+                        http_compress=self._http_compress,
+                        serializer=self._serializer
+                    )
+        return self._es
+    
+    def _is_enabled(self, level: str) -> bool:
+        """级别是否不低于 min_level（不区分大小写，未知级别总是记录）"""
+        n = LEVELS.get(level)
+        if n is None:
+            # 只有不常见的大小写组合（如 "wArN"）和未知级别才需要转换
+            n = LEVELS.get(level.upper(), 100)
+        return n >= self._min_level_n
         
     def log(self, 
             message: str, 
@@ -48,9 +380,9 @@ class ElasticsearchLogger:
             actual_value: Optional[str] = None,
             result: Optional[str] = None,
             additional_fields: Optional[Dict[str, Any]] = None,
-            index: Optional[str] = None) -> Dict:
+            index: Optional[str] = None) -> Optional[Tuple[int, List]]:
         """
-        同步方式记录日志到Elasticsearch
+        同步方式记录日志到Elasticsearch（写入缓冲区，达到阈值时批量刷新）
         
         参数:
             message: 日志消息内容
@@ -64,37 +396,126 @@ class ElasticsearchLogger:
             action: 执行的操作（处理日志）
             expected_value: 期望值（处理日志）
             actual_value: 实际值（处理日志）
-            result: 结果（处理日志）
+            result: 结果（处理日志，未指定时根据期望值和实际值计算：
+                    写入 mh-logs-process 时由 ingest pipeline 计算，写入其他索引时在本地计算）
             additional_fields: 要包含的额外字段
             index: 覆盖默认的索引/数据流名称
             
         返回:
-            Elasticsearch响应字典
+            触发刷新时返回 (成功条数, 错误列表)，否则返回 None；
+            日志暂存在缓冲区中，可调用 flush_sync()/close_sync()
+            （或异步的 flush()/close()）写出剩余日志
         """
-        log_entry = self._create_log_entry(
-            message=message,
-            level=level,
-            service=service,
-            log_type=log_type,
-            logger=logger,
-            environment=environment,
-            model=model,
-            method=method,
-            action=action,
-            expected_value=expected_value,
-            actual_value=actual_value,
-            result=result,
-            additional_fields=additional_fields
-        )
+        if not self._is_enabled(level):
+            return None
         
-        target_index = index or f"{self.default_index}-{log_type}"
+        target_index = (index or self._index_for.get(log_type)
+                        or f"{self.default_index}-{log_type}")
         if not target_index:
             raise ValueError("未指定索引且未设置默认索引")
-            
-        return self.es.index(
-            index=target_index,
-            document=log_entry
+        if log_type == "process":
+            result = _process_result(target_index, expected_value, actual_value, result)
+        
+        log_entry = self._create_log_entry(
+            message, level, service, log_type,
+            logger, environment,
+            model, method, action, expected_value, actual_value, result,
+            additional_fields
         )
+        return self._write(target_index, log_entry)
+    
+    def log_common(self,
+                   message: str,
+                   level: str = "INFO",
+                   service: str = "python-app",
+                   logger: Optional[str] = None,
+                   environment: Optional[str] = None,
+                   additional_fields: Optional[Dict[str, Any]] = None,
+                   index: Optional[str] = None) -> Optional[Tuple[int, List]]:
+        """
+        同步方式记录通用日志，等价于 log(log_type="common")
+        
+        只接收通用日志的参数，不经过按日志类型的分支，适合高频调用。
+        
+        参数:
+            参数与 log 方法中的同名参数相同
+            
+        返回:
+            触发刷新时返回 (成功条数, 错误列表)，否则返回 None
+        """
+        if not self._is_enabled(level):
+            return None
+        
+        log_entry = self._add_common_fields(self._base_entry(message, level, service),
+                                            logger, environment, additional_fields)
+        return self._write(index or self._index_for["common"], log_entry)
+    
+    def log_process(self,
+                    message: str,
+                    level: str = "INFO",
+                    service: str = "python-app",
+                    model: Optional[str] = None,
+                    method: Optional[str] = None,
+                    action: Optional[str] = None,
+                    expected_value: Optional[str] = None,
+                    actual_value: Optional[str] = None,
+                    result: Optional[str] = None,
+                    additional_fields: Optional[Dict[str, Any]] = None,
+                    index: Optional[str] = None) -> Optional[Tuple[int, List]]:
+        """
+        同步方式记录处理日志，等价于 log(log_type="process")
+        
+        只接收处理日志的参数，不经过按日志类型的分支，适合高频调用。
+        
+        参数:
+            参数与 log 方法中的同名参数相同
+            
+        返回:
+            触发刷新时返回 (成功条数, 错误列表)，否则返回 None
+        """
+        if not self._is_enabled(level):
+            return None
+        
+        target_index = index or self._index_for["process"]
+        result = _process_result(target_index, expected_value, actual_value, result)
+        log_entry = self._add_process_fields(self._base_entry(message, level, service),
+                                             model, method, action,
+                                             expected_value, actual_value, result,
+                                             additional_fields)
+        return self._write(target_index, log_entry)
+    
+    def log_raw(self,
+                message: str,
+                level: str = "INFO",
+                service: str = "python-app",
+                logger: Optional[str] = None,
+                environment: Optional[str] = None,
+                index: Optional[str] = None) -> Optional[Tuple[int, List]]:
+        """
+        同步方式记录通用日志的快速路径
+        
+        不构建日志字典：service/level/logger/environment 使用缓存的 JSON 片段，
+        只序列化时间戳和消息，拼接出的文档直接放入缓冲区，批量写入时不再重新编码。
+        
+        参数:
+            参数与 log 方法中通用日志相关的参数相同
+            
+        返回:
+            触发刷新时返回 (成功条数, 错误列表)，否则返回 None
+        """
+        if not self._is_enabled(level):
+            return None
+        
+        static = _static_fields_json(service, level, logger, environment)
+        source = (b'{' + static
+                  + b',"@timestamp":' + orjson.dumps(_utc_timestamp())
+                  + b',"message":' + orjson.dumps(message)
+                  + b'}')
+        
+        target_index = index or self._index_for["common"]
+        if self._append(target_index, source):
+            return self.flush_sync()
+        return None
     
     async def log_async(self, 
                        message: str, 
@@ -112,40 +533,81 @@ class ElasticsearchLogger:
                        actual_value: Optional[str] = None,
                        result: Optional[str] = None,
                        additional_fields: Optional[Dict[str, Any]] = None,
-                       index: Optional[str] = None) -> Dict:
+                       index: Optional[str] = None) -> None:
         """
-        异步方式记录日志到Elasticsearch
+        异步方式记录日志到Elasticsearch（放入队列，由后台消费者批量写入）
         
         参数:
             参数与同步log方法相同
-            
-        返回:
-            Elasticsearch响应字典
         """
-        log_entry = self._create_log_entry(
-            message=message,
-            level=level,
-            service=service,
-            log_type=log_type,
-            logger=logger,
-            environment=environment,
-            model=model,
-            method=method,
-            action=action,
-            expected_value=expected_value,
-            actual_value=actual_value,
-            result=result,
-            additional_fields=additional_fields
-        )
+        if not self._is_enabled(level):
+            return
         
-        target_index = index or f"{self.default_index}-{log_type}"
+        target_index = (index or self._index_for.get(log_type)
+                        or f"{self.default_index}-{log_type}")
         if not target_index:
             raise ValueError("未指定索引且未设置默认索引")
-            
-        return await self.async_es.index(
-            index=target_index,
-            document=log_entry
+        if log_type == "process":
+            result = _process_result(target_index, expected_value, actual_value, result)
+        
+        extras = self._add_fields(
+            {}, log_type,
+            logger, environment,
+            model, method, action, expected_value, actual_value, result,
+            additional_fields
         )
+        await self._put(LogEntry(time.time_ns(), target_index,
+                                 message, level, service, extras or None))
+    
+    async def log_common_async(self,
+                               message: str,
+                               level: str = "INFO",
+                               service: str = "python-app",
+                               logger: Optional[str] = None,
+                               environment: Optional[str] = None,
+                               additional_fields: Optional[Dict[str, Any]] = None,
+                               index: Optional[str] = None) -> None:
+        """
+        异步方式记录通用日志，等价于 log_async(log_type="common")
+        
+        参数:
+            参数与 log_common 方法相同
+        """
+        if not self._is_enabled(level):
+            return
+        
+        extras = self._add_common_fields({}, logger, environment, additional_fields)
+        await self._put(LogEntry(time.time_ns(), index or self._index_for["common"],
+                                 message, level, service, extras or None))
+    
+    async def log_process_async(self,
+                                message: str,
+                                level: str = "INFO",
+                                service: str = "python-app",
+                                model: Optional[str] = None,
+                                method: Optional[str] = None,
+                                action: Optional[str] = None,
+                                expected_value: Optional[str] = None,
+                                actual_value: Optional[str] = None,
+                                result: Optional[str] = None,
+                                additional_fields: Optional[Dict[str, Any]] = None,
+                                index: Optional[str] = None) -> None:
+        """
+        异步方式记录处理日志，等价于 log_async(log_type="process")
+        
+        参数:
+            参数与 log_process 方法相同
+        """
+        if not self._is_enabled(level):
+            return
+        
+        target_index = index or self._index_for["process"]
+        result = _process_result(target_index, expected_value, actual_value, result)
+        extras = self._add_process_fields({}, model, method, action,
+                                          expected_value, actual_value, result,
+                                          additional_fields)
+        await self._put(LogEntry(time.time_ns(), target_index,
+                                 message, level, service, extras or None))
     
     def _create_log_entry(self,
                          message: str,
@@ -162,56 +624,454 @@ class ElasticsearchLogger:
                          expected_value: Optional[str],
                          actual_value: Optional[str],
                          result: Optional[str],
-                         additional_fields: Optional[Dict[str, Any]]) -> Dict:
+                         additional_fields: Optional[Dict[str, Any]]) -> Dict[str, Any]:
         """
-        创建标准化的日志条目字典
+        按日志类型创建标准化的日志条目字典
         
         返回:
             格式化后的日志字典
         """
-        log_entry = {
-            "@timestamp": datetime.now(timezone.utc).isoformat(),
+        return self._add_fields(
+            self._base_entry(message, level, service), log_type,
+            logger, environment,
+            model, method, action, expected_value, actual_value, result,
+            additional_fields
+        )
+    
+    @staticmethod
+    def _base_entry(message: str, level: str, service: str) -> Dict[str, Any]:
+        """创建只包含基础字段的日志条目字典"""
+        return {
+            "@timestamp": _utc_timestamp(),
             "message": message,
             "level": level,
             "service": service,
         }
-        
-        # 根据日志类型添加特定字段
+    
+    def _add_fields(self,
+                    fields: Dict[str, Any],
+                    log_type: str,
+                    # 通用日志字段
+                    logger: Optional[str],
+                    environment: Optional[str],
+                    # 处理日志字段
+                    model: Optional[str],
+                    method: Optional[str],
+                    action: Optional[str],
+                    expected_value: Optional[str],
+                    actual_value: Optional[str],
+                    result: Optional[str],
+                    additional_fields: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """按日志类型将特定字段和额外字段添加到 fields 中并返回 fields"""
         if log_type == "common":
-            if logger is not None:
-                log_entry["logger"] = logger
-            if environment is not None:
-                log_entry["environment"] = environment
-        elif log_type == "process":
-            if model is not None:
-                log_entry["model"] = model
-            if method is not None:
-                log_entry["method"] = method
-            if action is not None:
-                log_entry["action"] = action
-            if expected_value is not None:
-                log_entry["expected_value"] = expected_value
-            if actual_value is not None:
-                log_entry["actual_value"] = actual_value
-            if result is not None:
-                log_entry["result"] = result
-            elif actual_value is not None and expected_value is not None:
-                log_entry["result"] = "success" if actual_value == expected_value else "failure"
+            return self._add_common_fields(fields, logger, environment, additional_fields)
+        if log_type == "process":
+            return self._add_process_fields(fields, model, method, action,
+                                            expected_value, actual_value, result,
+                                            additional_fields)
         
+        # 其他日志类型只包含基础字段
+        if additional_fields:
+            fields.update(additional_fields)
+        return fields
+    
+    @staticmethod
+    def _add_common_fields(fields: Dict[str, Any],
+                           logger: Optional[str],
+                           environment: Optional[str],
+                           additional_fields: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """将通用日志字段和额外字段添加到 fields 中并返回 fields"""
+        if logger is not None:
+            fields["logger"] = logger
+        if environment is not None:
+            fields["environment"] = environment
         if additional_fields:
-            log_entry.update(additional_fields)
+            fields.update(additional_fields)
+        return fields
+    
+    @staticmethod
+    def _add_process_fields(fields: Dict[str, Any],
+                            model: Optional[str],
+                            method: Optional[str],
+                            action: Optional[str],
+                            expected_value: Optional[str],
+                            actual_value: Optional[str],
+                            result: Optional[str],
+                            additional_fields: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """将处理日志字段和额外字段添加到 fields 中并返回 fields"""
+        # 逐个判断 None 后赋值比先构建完整字典再过滤 None 更快（CPython 3.11 实测），
+        # 因此这里保留 if 链
+        if model is not None:
+            fields["model"] = model
+        if method is not None:
+            fields["method"] = method
+        if action is not None:
+            fields["action"] = action
+        if expected_value is not None:
+            fields["expected_value"] = expected_value
+        if actual_value is not None:
+            fields["actual_value"] = actual_value
+        # result 已由调用方按目标索引处理（见 _process_result），未指定时留给 ingest pipeline
+        if result is not None:
+            fields["result"] = result
+        if additional_fields:
+            fields.update(additional_fields)
+        return fields
+    
+    def _write(self, target_index: str, log_entry: Dict[str, Any]) -> Optional[Tuple[int, List]]:
+        """序列化日志条目并写入同步缓冲区，达到阈值时批量刷新"""
+        if self._append(target_index, self._serializer.dumps_bytes(log_entry)):
+            return self.flush_sync()
+        return None
+    
+    async def _put(self, entry: LogEntry):
+        """将日志放入异步队列（队列满时等待）"""
+        self._ensure_consumer()
+        await self._queue.put(entry)
+    
+    def _append(self, target_index: str, source: bytes) -> bool:
+        """
+        将已序列化的日志文档以 NDJSON 格式追加到缓冲区
+        
+        文档在写入缓冲区时即完成序列化，刷新时整块发送，不再逐条构建和编码操作。
+        日志只追加不更新，使用 create 操作写入数据流。
+        
+        返回:
+            是否达到刷新阈值（条数、字节数或刷新间隔）
+        """
+        with self._lock:
+            if self._flush_thread is None:
+                self._start_flush_thread()
+            self._buffer += _create_action(target_index)
+            self._buffer += source
+            self._buffer += b"\n"
+            self._buffer_docs += 1
+            return (self._buffer_docs >= self.max_batch_docs
+                    or len(self._buffer) >= self.max_batch_bytes
+                    or time.monotonic() - self._last_flush >= self.flush_interval_s)
+    
+    def _take_buffer(self) -> Tuple[bytes, int]:
+        """
+        取出并清空缓冲区
+        
+        返回:
+            (NDJSON 请求体, 日志条数)
+        """
+        with self._lock:
+            body = bytes(self._buffer)
+            docs = self._buffer_docs
+            self._buffer.clear()
+            self._buffer_docs = 0
+            self._last_flush = time.monotonic()
+        return body, docs
+    
+    @staticmethod
+    def _bulk_result(response: Dict, docs: int) -> Tuple[int, List]:
+        """
+        解析只保留错误信息的 Bulk 响应（filter_path=errors,items.*.error）
+        
+        返回:
+            (成功条数, 错误列表)，有失败条目时抛出 BulkIndexError
+        """
+        if not response.get("errors"):
+            return docs, []
+        errors = response.get("items", [])
+        if errors:
+            raise BulkIndexError(f"{len(errors)} document(s) failed to index.", errors)
+        return docs, errors
+    
+    def flush_sync(self) -> Optional[Tuple[int, List]]:
+        """
+        使用同步客户端批量写入缓冲区中的日志（无需事件循环）
+        
+        返回:
+            (成功条数, 错误列表)，缓冲区为空时返回 None
+        """
+        body, docs = self._take_buffer()
+        if not docs:
+            return None
+        response = self.es.bulk(body=body, **_BULK_PARAMS)
+        return self._bulk_result(response, docs)
+    
+    def _start_flush_thread(self):
+        """
+        启动定时刷新同步缓冲区的守护线程（调用方持有 self._lock）
+        
+        同时注册终结器，记录器未关闭就被回收或进程退出时写出缓冲区中剩余的日志；
+        close()/close_sync() 自行刷新，并注销终结器。
+        """
+        self._flush_thread = threading.Thread(
+            target=self._flush_periodically,
+            args=(weakref.ref(self), self._flush_stop, self.flush_interval_s),
+            name="ElasticsearchLogger-flush",
+            daemon=True
+        )
+        self._flush_thread.start()
+        # 终结器不能引用 self，只持有缓冲区和同步客户端（因此在这里提前创建客户端）
+        self._finalizer = weakref.finalize(
+            self, self._flush_remaining,
+            self._buffer, self._lock, self.es, self._flush_stop
+        )
+    
+    @staticmethod
+    def _flush_periodically(logger_ref: "weakref.ref", stop: threading.Event, interval: float):
+        """
+        守护线程主体：每隔 interval 秒写出同步缓冲区中的日志
+        
+        只持有日志记录器的弱引用，记录器被回收或关闭后线程退出。
+        """
+        while not stop.wait(interval):
+            logger = logger_ref()
+            if logger is None:
+                return
+            logger._flush_background()
+            del logger
+    
+    @staticmethod
+    def _flush_remaining(buffer: bytearray,
+                         lock: threading.Lock,
+                         es: Elasticsearch,
+                         stop: threading.Event):
+        """终结器主体：停止守护线程并写出同步缓冲区中剩余的日志"""
+        stop.set()
+        with lock:
+            body = bytes(buffer)
+            buffer.clear()
+        if body:
+            # 每条日志占操作行和文档行两行
+            ElasticsearchLogger._send_bulk(es, body, body.count(b"\n") // 2)
+    
+    def _flush_background(self):
+        """在后台写出同步缓冲区，失败时记录日志并计入丢弃条数"""
+        body, docs = self._take_buffer()
+        if docs:
+            dropped = self._send_bulk(self.es, body, docs)
+            if dropped:
+                self._count_dropped(dropped)
+    
+    @staticmethod
+    def _send_bulk(es: Elasticsearch, body: bytes, docs: int) -> int:
+        """
+        在后台发送 Bulk 请求，失败时记录日志而不抛出异常
+        
+        返回:
+            丢弃的日志条数
+        """
+        try:
+            ElasticsearchLogger._bulk_result(es.bulk(body=body, **_BULK_PARAMS), docs)
+        except BulkIndexError as e:
+            _log.exception("后台批量写入日志部分失败，已丢弃 %d 条日志", len(e.errors))
+            return len(e.errors)
+        except Exception:
+            _log.exception("后台批量写入日志失败，已丢弃 %d 条日志", docs)
+            return docs
+        return 0
+    
+    @staticmethod
+    def _bulk_url(host: str) -> str:
+        """
+        由主机地址得到 Bulk API 的完整 URL
+        
+        与 elasticsearch-py 一致：未指定协议时使用 http，http 地址未指定端口时使用 9200。
+        """
+        if "://" not in host:
+            host = f"http://{host}"
+        parts = urlsplit(host)
+        netloc = parts.netloc
+        if parts.port is None and parts.scheme != "https":
+            netloc = f"{netloc}:9200"
+        return urlunsplit((parts.scheme, netloc, f"{parts.path.rstrip('/')}/_bulk", "", ""))
+    
+    @staticmethod
+    def _create_http_client(maxsize: int, timeout: int) -> "httpx.AsyncClient":
+        """
+        创建 httpx 异步客户端
+        
+        使用 HTTP/1.1（Elasticsearch 7.x 不支持 HTTP/2），
+        连接池上限与 AsyncElasticsearch 的 maxsize 相同。
+        """
+        return httpx.AsyncClient(limits=httpx.Limits(max_connections=maxsize),
+                                 timeout=timeout)
+    
+    async def _bulk_async(self, body: bytes, docs: int) -> Tuple[int, List]:
+        """发送 NDJSON 格式的 Bulk 请求体（优先使用 httpx 快速通道）"""
+        if self._bulk_urls is None:
+            response = await self.async_es.bulk(body=body, **_BULK_PARAMS)
+            return self._bulk_result(response, docs)
+        if self._http is None:
+            self._http = self._create_http_client(self._maxsize, self._timeout)
+        
+        headers = {"Content-Type": "application/x-ndjson"}
+        if self._http_compress:
+            body = gzip.compress(body)
+            headers["Content-Encoding"] = "gzip"
+        return self._bulk_result(await self._post_bulk(body, headers), docs)
+    
+    async def _post_bulk(self, body: bytes, headers: Dict[str, str]) -> Dict:
+        """
+        用 httpx 发送 Bulk 请求，连接失败或节点返回 502/503/504 时换下一个节点重试
+        
+        与 elasticsearch-py 一致：超时不重试（请求可能已被处理），
+        错误统一转换为 elasticsearch 的异常类型。
+        
+        返回:
+            解析后的 Bulk 响应
+        """
+        # 至少重试一次，多节点时每个节点各尝试一次
+        attempts = max(2, self._bulk_url_count)
+        for attempt in range(1, attempts + 1):
+            try:
+                response = await self._http.post(next(self._bulk_urls), content=body,
+                                                 headers=headers, params=_BULK_PARAMS)
+            except httpx.TimeoutException as e:
+                raise ConnectionTimeout("TIMEOUT", str(e), e)
+            except httpx.TransportError as e:
+                if attempt < attempts:
+                    continue
+                raise ESConnectionError("N/A", str(e), e)
             
-        return log_entry
+            if response.status_code in (502, 503, 504) and attempt < attempts:
+                continue
+            if response.status_code >= 300:
+                try:
+                    info = orjson.loads(response.content)
+                except orjson.JSONDecodeError:
+                    info = response.text
+                error = info.get("error", response.text) if isinstance(info, dict) else response.text
+                if isinstance(error, dict):
+                    error = error.get("type", error)
+                raise HTTP_EXCEPTIONS.get(response.status_code, TransportError)(
+                    response.status_code, error, info)
+            return orjson.loads(response.content)
+    
+    async def flush(self) -> Optional[Tuple[int, List]]:
+        """
+        批量写入同步缓冲区中的日志，并等待异步队列中的日志全部写入
+        
+        返回:
+            同步缓冲区的写入结果 (成功条数, 错误列表)，缓冲区为空时返回 None
+        """
+        response = None
+        body, docs = self._take_buffer()
+        if docs:
+            response = await self._bulk_async(body, docs)
+        if self._queue is not None:
+            await self._queue.join()
+        return response
+    
+    def _ensure_consumer(self):
+        """在当前事件循环中创建异步日志队列并启动消费者任务（如尚未启动）"""
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.queue_maxsize)
+        if self._consumer is None or self._consumer.done():
+            self._consumer = asyncio.create_task(self._drain())
+    
+    async def _wait_batch_window(self):
+        """
+        等待一个攒批窗口，并根据事件循环利用率调整下一个窗口
+        
+        以窗口睡眠的超时（事件循环延迟）相对最小窗口的比例近似事件循环利用率：
+        利用率高于 0.8 时缩短到最小窗口，尽快写出；低于 0.3 时放宽到最大窗口，攒更大的批。
+        """
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        await asyncio.sleep(self._batch_window)
+        lag = max(0.0, loop.time() - start - self._batch_window)
+        utilization = lag / (lag + self._min_batch_s) if lag else 0.0
+        if utilization > 0.8:
+            self._batch_window = self._min_batch_s
+        elif utilization < 0.3:
+            self._batch_window = self._max_batch_s
+    
+    async def _drain(self):
+        """
+        消费异步日志队列：等待一个攒批窗口后取出已排队的日志，
+        逐条组装文档并直接序列化为 NDJSON 请求体，通过 Bulk API 写入
+        """
+        while True:
+            entry = await self._queue.get()
+            # 已积压满一批时无需再等待
+            if self._queue.qsize() < self.max_batch_docs - 1:
+                await self._wait_batch_window()
+            body = bytearray()
+            taken = docs = 0
+            while True:
+                taken += 1
+                try:
+                    source = self._serializer.dumps_bytes(entry.to_document())
+                except SerializationError:
+                    _log.exception("序列化异步日志失败，已丢弃该条日志")
+                    self._count_dropped(1)
+                else:
+                    body += _create_action(entry.index)
+                    body += source
+                    body += b"\n"
+                    docs += 1
+                if taken >= self.max_batch_docs or len(body) >= self.max_batch_bytes:
+                    break
+                try:
+                    entry = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+            try:
+                if docs:
+                    await self._bulk_async(bytes(body), docs)
+            except BulkIndexError as e:
+                _log.exception("批量写入异步日志部分失败，已丢弃 %d 条日志", len(e.errors))
+                self._count_dropped(len(e.errors))
+            except Exception:
+                _log.exception("批量写入异步日志失败，已丢弃 %d 条日志", docs)
+                self._count_dropped(docs)
+            finally:
+                for _ in range(taken):
+                    self._queue.task_done()
+    
+    def _count_dropped(self, count: int):
+        """累加丢弃的日志条数（可能在后台线程和事件循环中同时调用）"""
+        with self._lock:
+            self.dropped_logs += count
     
     async def close(self):
-        """关闭同步和异步客户端连接"""
-        self.es.close()
-        await self.async_es.close()
+        """刷新缓冲区和异步队列，然后关闭同步和异步客户端连接"""
+        self._forget()
+        self._flush_stop.set()
+        if self._finalizer is not None:
+            self._finalizer.detach()
+        try:
+            await self.flush()
+        finally:
+            # 刷新失败（如集群不可用）时也要关闭连接
+            if self._consumer is not None:
+                self._consumer.cancel()
+                self._consumer = None
+            # 同步客户端未创建过时无需关闭
+            if self._es is not None:
+                self._es.close()
+            if self._http is not None:
+                await self._http.aclose()
+            await self.async_es.close()
+    
+    def close_sync(self):
+        """
+        同步方式刷新缓冲区并关闭同步客户端连接
+        
+        供只使用同步接口（不运行事件循环）的程序调用；
+        使用过异步接口时应改用 close()，以便写完异步队列并关闭异步客户端。
+        """
+        self._forget()
+        self._flush_stop.set()
+        if self._finalizer is not None:
+            self._finalizer.detach()
+        try:
+            self.flush_sync()
+        finally:
+            if self._es is not None:
+                self._es.close()
 
 # 示例用法
 async def main():
     # 初始化日志记录器
-    logger = ElasticsearchLogger(default_index="mh-logs")
+    logger = ElasticsearchLogger.get(default_index="mh-logs")
     
     try:
         # 通用日志示例
@@ -232,30 +1092,34 @@ async def main():
             expected_value="0.95",
             actual_value="0.96"
         )
-        # 处理日志示例
-        process_response = await logger.log_async(
-            "模型验证完成",
-            level="INFO",
-            log_type="process",
-            model="nlp-model-v1",
-            method="validate",
-            expected_value="0.95",
-            actual_value="0.96"
+        # 互不依赖的异步日志并发提交，由后台任务合并为一次批量写入
+        await asyncio.gather(
+            # 处理日志示例
+            logger.log_async(
+                "模型验证完成",
+                level="INFO",
+                log_type="process",
+                model="nlp-model-v1",
+                method="validate",
+                expected_value="0.95",
+                actual_value="0.96"
+            ),
+            # 带额外字段的日志
+            logger.log_async(
+                "自定义日志示例",
+                level="DEBUG",
+                log_type="common",
+                additional_fields={
+                    "user_id": 123,
+                    "operation": "数据导出",
+                    "duration_ms": 245
+                }
+            )
         )
-        print("处理异步日志写入结果:", process_response)
         
-        # 带额外字段的日志
-        custom_response = await logger.log_async(
-            "自定义日志示例",
-            level="DEBUG",
-            log_type="common",
-            additional_fields={
-                "user_id": 123,
-                "operation": "数据导出",
-                "duration_ms": 245
-            }
-        )
-        print("自定义异步日志写入结果:", custom_response)
+        # 将缓冲区和异步队列中剩余的日志批量写入
+        flush_response = await logger.flush()
+        print("批量写入结果:", flush_response)
         
     finally:
         # 正确清理资源